@@ -1,27 +1,78 @@
 import os
-import json
+import re
+import sys
+import orjson
 from typing import Dict, Any, List, Optional
+from cachetools.func import ttl_cache
 from fastmcp import FastMCP
+from google.api_core.exceptions import Forbidden
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
+# Optional: BigQuery Storage Read API for columnar (Arrow) result downloads
+try:
+    import pyarrow  # noqa: F401
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
+
 # Hardcoded configuration
 PROJECT_ID = "[Insert your project ID here]"
 DATASET_ID = "[Insert your dataset ID here]"
+MAXIMUM_BYTES_BILLED = 10 * 10**9  # Queries that would bill more than this fail instead of running
 
 # Initialize FastMCP server
 mcp = FastMCP("bigquery-server",
               dependencies=["google-cloud-bigquery",
+        "google-cloud-bigquery-storage",
+        "pyarrow",
+        "orjson",
+        "cachetools",
         "google-auth",
         "google-auth-oauthlib",
         "google-auth-httplib2"])
 
+# Bare table references rewritten to fully qualified names in query_bigquery
+_TABLE_PATTERNS = [
+    (re.compile(r'\bFROM\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', re.IGNORECASE), f'FROM `{PROJECT_ID}.{DATASET_ID}.\\1`'),
+    (re.compile(r'\bINTO\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', re.IGNORECASE), f'INTO `{PROJECT_ID}.{DATASET_ID}.\\1`'),
+    (re.compile(r'\bUPDATE\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', re.IGNORECASE), f'UPDATE `{PROJECT_ID}.{DATASET_ID}.\\1`'),
+    (re.compile(r'\bTABLE\s+(?!IF\s+EXISTS)([a-zA-Z_][a-zA-Z0-9_]*)\b', re.IGNORECASE), f'TABLE `{PROJECT_ID}.{DATASET_ID}.\\1`'),
+]
+
+# Cheap pre-check: does the query contain any bare table reference _TABLE_PATTERNS could rewrite?
+_NEEDS_REWRITE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+[a-zA-Z_]', re.IGNORECASE)
+
+# Leading keyword of a statement, and the statements whose rows query_bigquery returns
+_STATEMENT_KEYWORD = re.compile(r'\s*([A-Za-z]+)')
+_ROW_STATEMENTS = frozenset({"SELECT", "WITH"})
+
+# Results up to this size usually arrive on the first jobs.query page, where RowIterator
+# never opens a Storage API read session; Arrow conversion would then be pure overhead
+_ARROW_MIN_ROWS = 10000
+
 # Global BigQuery client
 _bq_client: Optional[bigquery.Client] = None
+_bq_credentials: Optional[service_account.Credentials] = None
+_bqstorage_client: Optional["bigquery_storage.BigQueryReadClient"] = None
+
+# Compact JSON by default; set MCP_PRETTY_JSON=1 for indented output
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+if os.getenv("MCP_PRETTY_JSON") == "1":
+    _JSON_OPTIONS |= orjson.OPT_INDENT_2
+
+def _dumps(obj: Any) -> str:
+    """Serialize query rows to a JSON string, stringifying Decimal/bytes/datetime values."""
+    # Datetimes go through default=str too, keeping the "2024-01-01 12:00:00+00:00" format
+    return orjson.dumps(
+        obj,
+        default=str,
+        option=_JSON_OPTIONS | orjson.OPT_PASSTHROUGH_DATETIME
+    ).decode()
 
 def get_bigquery_client() -> bigquery.Client:
     """Initialize BigQuery client with authentication."""
-    global _bq_client
+    global _bq_client, _bq_credentials
     
     if _bq_client is not None:
         return _bq_client
@@ -34,6 +85,7 @@ def get_bigquery_client() -> bigquery.Client:
             scopes=["https://www.googleapis.com/auth/bigquery"]
         )
         _bq_client = bigquery.Client(project=PROJECT_ID, credentials=credentials)
+        _bq_credentials = credentials
         return _bq_client
     
     # Method 2: Environment variable, you can set this to your path to Json file! 
@@ -53,6 +105,35 @@ def get_bigquery_client() -> bigquery.Client:
             "3. Run 'gcloud auth application-default login'"
         )
 
+def get_bqstorage_client() -> Optional["bigquery_storage.BigQueryReadClient"]:
+    """Return a shared BigQuery Storage read client, or None if it is not installed."""
+    global _bqstorage_client
+    
+    if _bqstorage_client is None and bigquery_storage is not None:
+        # Same credentials as the BigQuery client; None means Application Default Credentials
+        get_bigquery_client()
+        _bqstorage_client = bigquery_storage.BigQueryReadClient(credentials=_bq_credentials)
+    return _bqstorage_client
+
+def _rows_as_dicts(results: bigquery.table.RowIterator) -> List[Dict[str, Any]]:
+    """Materialize query rows page by page over the REST API."""
+    # Share one interned key string per column across every row dict. Rows are read by
+    # position because Row.values() deep-copies every value.
+    field_names = [sys.intern(field.name) for field in results.schema]
+    return [dict(zip(field_names, row)) for row in results]
+
+@ttl_cache(maxsize=256, ttl=30)
+def _get_table_cached(table_name: str) -> bigquery.Table:
+    """Fetch table metadata, memoized briefly across tool calls."""
+    client = get_bigquery_client()
+    return client.get_table(client.dataset(DATASET_ID).table(table_name))
+
+@ttl_cache(maxsize=1, ttl=30)
+def _get_dataset_cached() -> bigquery.Dataset:
+    """Fetch dataset metadata, memoized briefly across tool calls."""
+    client = get_bigquery_client()
+    return client.get_dataset(client.dataset(DATASET_ID))
+
 
 # @mcp.tool()
 # def spices() -> List[str]:
@@ -94,49 +175,57 @@ def query_bigquery(query: str) -> str:
     client = get_bigquery_client()
     
     # Auto-replace table references for convenience
-    if f"{PROJECT_ID}.{DATASET_ID}" not in query:
-        import re
-        patterns = [
-            (r'\bFROM\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', f'FROM `{PROJECT_ID}.{DATASET_ID}.\\1`'),
-            (r'\bINTO\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', f'INTO `{PROJECT_ID}.{DATASET_ID}.\\1`'),
-            (r'\bUPDATE\s+([a-zA-Z_][a-zA-Z0-9_]*)\b', f'UPDATE `{PROJECT_ID}.{DATASET_ID}.\\1`'),
-            (r'\bTABLE\s+(?!IF\s+EXISTS)([a-zA-Z_][a-zA-Z0-9_]*)\b', f'TABLE `{PROJECT_ID}.{DATASET_ID}.\\1`'),
-        ]
-        for pattern, replacement in patterns:
-            query = re.sub(pattern, replacement, query, flags=re.IGNORECASE)
+    if f"{PROJECT_ID}.{DATASET_ID}" not in query and _NEEDS_REWRITE.search(query):
+        for pattern, replacement in _TABLE_PATTERNS:
+            query = pattern.sub(replacement, query)
     
     try:
         # Configure query job
         job_config = bigquery.QueryJobConfig(
             use_query_cache=True,
-            use_legacy_sql=False
+            use_legacy_sql=False,
+            maximum_bytes_billed=MAXIMUM_BYTES_BILLED,
+            labels={"source": "mcp"}
         )
         
-        # Execute query
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
+        # Only SELECT/WITH results are returned; for DDL/DML just wait for completion
+        keyword = _STATEMENT_KEYWORD.match(query)
+        returns_rows = keyword is not None and keyword.group(1).upper() in _ROW_STATEMENTS
+        max_results = None if returns_rows else 0
         
-        # Format response based on query type
-        query_upper = query.upper().strip()
+        # Execute query; query_and_wait uses the single round-trip jobs.query API
+        # when the query finishes quickly
+        results = client.query_and_wait(query, job_config=job_config, max_results=max_results)
         
-        if query_upper.startswith(('SELECT', 'WITH')):
-            # Query returns results
-            rows = [dict(row) for row in results]
+        # Format response based on query type
+        if returns_rows:
+            # Query returns results; large ones are downloaded as Arrow batches when the Storage API is available
+            bqstorage_client = None
+            if results.total_rows is not None and results.total_rows > _ARROW_MIN_ROWS:
+                bqstorage_client = get_bqstorage_client()
+            if bqstorage_client is not None:
+                try:
+                    rows = results.to_arrow(bqstorage_client=bqstorage_client).to_pylist()
+                except Forbidden:
+                    # No bigquery.readsessions.create permission; to_arrow does not fall back itself
+                    rows = _rows_as_dicts(results)
+            else:
+                rows = _rows_as_dicts(results)
             
-            response = f"Query executed successfully. Found {results.total_rows} rows.\n\n"
-            response += "Schema:\n"
+            parts = [f"Query executed successfully. Found {results.total_rows} rows.", "", "Schema:"]
             for field in results.schema:
-                response += f"  - {field.name}: {field.field_type}\n"
+                parts.append(f"  - {field.name}: {field.field_type}")
             
-            response += "\nResults:\n"
-            response += json.dumps(rows, indent=2, default=str)
+            parts.extend(["", "Results:", _dumps(rows)])
             
-            return response
+            return "\n".join(parts)
         else:
-            # DDL/DML query
+            # DDL/DML query; cached metadata may now be stale
+            _get_table_cached.cache_clear()
+            _get_dataset_cached.cache_clear()
             response = "Query executed successfully."
-            if hasattr(query_job, 'num_dml_affected_rows') and query_job.num_dml_affected_rows:
-                response += f" Affected {query_job.num_dml_affected_rows} rows."
+            if results.num_dml_affected_rows:
+                response += f" Affected {results.num_dml_affected_rows} rows."
             return response
             
     except Exception as e:
@@ -153,36 +242,37 @@ def get_table_schema(table_name: str) -> str:
     Returns:
         Detailed table schema and metadata
     """
-    client = get_bigquery_client()
-    
     try:
-        table_ref = client.dataset(DATASET_ID).table(table_name)
-        table = client.get_table(table_ref)
-        
-        response = f"Schema for table '{table_name}':\n\n"
-        response += f"Total rows: {table.num_rows:,}\n"
-        response += f"Size: {table.num_bytes / 1024 / 1024:.2f} MB\n"
-        response += f"Created: {table.created}\n"
-        response += f"Last modified: {table.modified}\n\n"
+        table = _get_table_cached(table_name)
         
-        response += "Fields:\n"
+        parts = [
+            f"Schema for table '{table_name}':",
+            "",
+            f"Total rows: {table.num_rows:,}",
+            f"Size: {table.num_bytes / 1024 / 1024:.2f} MB",
+            f"Created: {table.created}",
+            f"Last modified: {table.modified}",
+            "",
+            "Fields:",
+        ]
         for field in table.schema:
-            response += f"  - {field.name} ({field.field_type})"
+            line = f"  - {field.name} ({field.field_type})"
             if field.mode != "NULLABLE":
-                response += f" [{field.mode}]"
+                line += f" [{field.mode}]"
             if field.description:
-                response += f" - {field.description}"
-            response += "\n"
+                line += f" - {field.description}"
+            parts.append(line)
         
         # Partitioning info
         if table.time_partitioning:
-            response += f"\nPartitioned by: {table.time_partitioning.field} ({table.time_partitioning.type_})\n"
+            parts.append("")
+            parts.append(f"Partitioned by: {table.time_partitioning.field} ({table.time_partitioning.type_})")
         
         # Clustering info
         if table.clustering_fields:
-            response += f"Clustered by: {', '.join(table.clustering_fields)}\n"
+            parts.append(f"Clustered by: {', '.join(table.clustering_fields)}")
         
-        return response
+        return "\n".join(parts)
         
     except Exception as e:
         return f"Error getting table schema: {str(e)}"
@@ -198,21 +288,41 @@ def list_tables() -> str:
     client = get_bigquery_client()
     
     try:
-        dataset_ref = client.dataset(DATASET_ID)
-        tables = list(client.list_tables(dataset_ref))
+        # One metadata query for all tables instead of a get_table call per table.
+        # INFORMATION_SCHEMA supplies the type name, spelled as the tables API reports it
+        # (TABLE, VIEW, MATERIALIZED_VIEW, SNAPSHOT, ...).
+        query = f"""
+        SELECT
+            t.table_id,
+            COALESCE(
+                IF(i.table_type = 'BASE TABLE', 'TABLE', REPLACE(i.table_type, ' ', '_')),
+                'UNKNOWN'
+            ) AS table_type,
+            t.row_count,
+            t.size_bytes
+        FROM `{PROJECT_ID}.{DATASET_ID}.__TABLES__` AS t
+        LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.INFORMATION_SCHEMA.TABLES` AS i
+            ON i.table_name = t.table_id
+        ORDER BY t.table_id
+        """
         
-        response = f"Tables in dataset '{DATASET_ID}':\n\n"
+        query_job = client.query(query)
+        tables = list(query_job.result())
+        
+        parts = [f"Tables in dataset '{DATASET_ID}':", ""]
         
         for table in tables:
-            table_full = client.get_table(table)
-            response += f"- {table.table_id}\n"
-            response += f"  Type: {table.table_type}\n"
-            response += f"  Rows: {table_full.num_rows:,}\n"
-            response += f"  Size: {table_full.num_bytes / 1024 / 1024:.2f} MB\n\n"
+            parts.extend([
+                f"- {table['table_id']}",
+                f"  Type: {table['table_type']}",
+                f"  Rows: {table['row_count']:,}",
+                f"  Size: {table['size_bytes'] / 1024 / 1024:.2f} MB",
+                "",
+            ])
         
-        response += f"Total tables: {len(tables)}"
+        parts.append(f"Total tables: {len(tables)}")
         
-        return response
+        return "\n".join(parts)
         
     except Exception as e:
         return f"Error listing tables: {str(e)}"
@@ -228,15 +338,17 @@ def get_dataset_info() -> str:
     client = get_bigquery_client()
     
     try:
-        dataset_ref = client.dataset(DATASET_ID)
-        dataset = client.get_dataset(dataset_ref)
+        dataset = _get_dataset_cached()
         
-        response = f"Dataset Information for '{DATASET_ID}':\n\n"
-        response += f"Project: {dataset.project}\n"
-        response += f"Location: {dataset.location}\n"
-        response += f"Created: {dataset.created}\n"
-        response += f"Modified: {dataset.modified}\n"
-        response += f"Description: {dataset.description or 'No description'}\n"
+        parts = [
+            f"Dataset Information for '{DATASET_ID}':",
+            "",
+            f"Project: {dataset.project}",
+            f"Location: {dataset.location}",
+            f"Created: {dataset.created}",
+            f"Modified: {dataset.modified}",
+            f"Description: {dataset.description or 'No description'}",
+        ]
         
         # Get dataset size using INFORMATION_SCHEMA
         query = f"""
@@ -251,11 +363,14 @@ def get_dataset_info() -> str:
         
         if results:
             stats = results[0]
-            response += f"\nStatistics:\n"
-            response += f"- Tables: {stats['table_count']}\n"
-            response += f"- Total size: {stats['total_size_gb']:.2f} GB\n"
+            parts.extend([
+                "",
+                "Statistics:",
+                f"- Tables: {stats['table_count']}",
+                f"- Total size: {stats['total_size_gb']:.2f} GB",
+            ])
         
-        return response
+        return "\n".join(parts)
         
     except Exception as e:
         return f"Error getting dataset info: {str(e)}"
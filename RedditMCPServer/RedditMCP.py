@@ -1,35 +1,169 @@
 # reddit_mcp_server.py
 import os
-import praw
+import threading
+from contextlib import asynccontextmanager
+from itertools import islice
+import asyncpraw
+import orjson
+from cachetools import TTLCache
 from fastmcp import FastMCP
 from dotenv import load_dotenv
-from typing import Optional, List, Dict, Any
-import json
+from typing import Optional, List, Dict, Any, AsyncIterator
 import requests
 import time
 
 # Load environment variables
 load_dotenv()
 
+# Reddit API credentials, read once at import
+REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID","[insert your client ID here]")
+REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET","[insert your client secret here]")
+REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "test script by /u/tester")
+REDDIT_USERNAME = os.getenv("REDDIT_USERNAME")  # Optional
+REDDIT_PASSWORD = os.getenv("REDDIT_PASSWORD")  # Optional
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    """Close the shared Reddit client's HTTP session when the server shuts down."""
+    global _reddit_client
+    try:
+        yield {}
+    finally:
+        if _reddit_client is not None:
+            await _reddit_client.close()
+            _reddit_client = None
+
 # Initialize FastMCP server
 mcp = FastMCP(
     name="Reddit MCP Server",
-    instructions="This server provides access to Reddit posts and subreddit information using the Reddit API."
+    instructions="This server provides access to Reddit posts and subreddit information using the Reddit API.",
+    lifespan=_lifespan
 )
 
+# Compact JSON by default; set MCP_PRETTY_JSON=1 for indented output
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+if os.getenv("MCP_PRETTY_JSON") == "1":
+    _JSON_OPTIONS |= orjson.OPT_INDENT_2
+
+def _dumps(obj: Any) -> str:
+    """Serialize a tool response to a JSON string."""
+    return orjson.dumps(
+        obj,
+        option=_JSON_OPTIONS
+    ).decode()
+
+def _trunc(text: str, limit: int) -> str:
+    """Truncate text to limit characters, marking the cut with an ellipsis."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+# Listing tools pass submissions built from the listing JSON only. asyncpraw never fetches
+# missing attributes lazily; reading a field absent from that JSON raises AttributeError,
+# so check a field is present in listing responses before reading it here.
+def _post_to_dict(
+    post,
+    selftext_limit: Optional[int] = None,
+    include_subreddit: bool = True,
+    compact: bool = False
+) -> Dict[str, Any]:
+    """
+    Build the response entry for a submission.
+    
+    Args:
+        post: Submission to convert
+        selftext_limit: Truncate selftext to this many characters, if given
+        include_subreddit: Include the submission's subreddit name
+        compact: Omit the voting, flag and flair fields (search results)
+    
+    Returns:
+        Dict of post fields
+    """
+    author = post.author
+    selftext = post.selftext
+    # Keys are added in stages so optional fields keep their usual position
+    info = {
+        "id": post.id,
+        "title": post.title,
+        "author": str(author) if author is not None else "[deleted]"
+    }
+    if include_subreddit:
+        info["subreddit"] = str(post.subreddit)
+    info["score"] = post.score
+    if not compact:
+        info["upvote_ratio"] = post.upvote_ratio
+    info["num_comments"] = post.num_comments
+    info["created_utc"] = post.created_utc
+    info["url"] = post.url
+    info["permalink"] = f"https://reddit.com{post.permalink}"
+    info["selftext"] = selftext if selftext_limit is None else _trunc(selftext, selftext_limit)
+    if not compact:
+        info["is_self"] = post.is_self
+        info["over_18"] = post.over_18
+        info["spoiler"] = post.spoiler
+        info["stickied"] = post.stickied
+        info["flair_text"] = post.link_flair_text
+    return info
+
+def _comment_to_dict(comment) -> Dict[str, Any]:
+    """Build the response entry for a comment."""
+    author = comment.author
+    return {
+        "id": comment.id,
+        "author": str(author) if author is not None else "[deleted]",
+        "body": _trunc(comment.body, 300),
+        "score": comment.score,
+        "created_utc": comment.created_utc,
+        "is_submitter": comment.is_submitter,
+        "stickied": comment.stickied,
+        "gilded": comment.gilded
+    }
+
+# Subreddit listing for each get_subreddit_posts sort_type; time_filter only applies to 'top'
+_SORT_DISPATCH = {
+    "hot": lambda subreddit, limit, time_filter: subreddit.hot(limit=limit),
+    "new": lambda subreddit, limit, time_filter: subreddit.new(limit=limit),
+    "top": lambda subreddit, limit, time_filter: subreddit.top(time_filter=time_filter, limit=limit),
+    "rising": lambda subreddit, limit, time_filter: subreddit.rising(limit=limit),
+}
+
+# Response caches keyed on tool arguments. Listings churn quickly, post and
+# subreddit details much less so.
+_listing_cache: TTLCache = TTLCache(maxsize=512, ttl=60)
+_details_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_cache_lock = threading.Lock()
+
+def _cache_get(cache: TTLCache, key: tuple) -> Optional[str]:
+    """Return a cached tool response, or None on a miss."""
+    with _cache_lock:
+        return cache.get(key)
+
+def _cache_set(cache: TTLCache, key: tuple, response: str) -> str:
+    """Store a tool response and return it."""
+    with _cache_lock:
+        cache[key] = response
+    return response
+
+# Global Reddit client, shared across tool calls on the server's event loop
+_reddit_client: Optional[asyncpraw.Reddit] = None
+
 # Initialize Reddit API client
-def get_reddit_client():
+async def get_reddit_client() -> asyncpraw.Reddit:
     """Initialize and return a Reddit client instance."""
-    return praw.Reddit(
-        client_id=os.getenv("REDDIT_CLIENT_ID","[insert your client ID here]"),
-        client_secret=os.getenv("REDDIT_CLIENT_SECRET","[insert your client secret here]"),
-        user_agent=os.getenv("REDDIT_USER_AGENT", "test script by /u/tester"),
-        username=os.getenv("REDDIT_USERNAME"),  # Optional
-        password=os.getenv("REDDIT_PASSWORD")   # Optional
+    global _reddit_client
+
+    if _reddit_client is not None:
+        return _reddit_client
+
+    _reddit_client = asyncpraw.Reddit(
+        client_id=REDDIT_CLIENT_ID,
+        client_secret=REDDIT_CLIENT_SECRET,
+        user_agent=REDDIT_USER_AGENT,
+        username=REDDIT_USERNAME,
+        password=REDDIT_PASSWORD
     )
+    return _reddit_client
 
 @mcp.tool()
-def get_subreddit_posts(
+async def get_subreddit_posts(
     subreddit_name: str,
     sort_type: str = "hot",
     limit: int = 10,
@@ -47,57 +181,37 @@ def get_subreddit_posts(
     Returns:
         JSON string containing post information
     """
+    key = ("get_subreddit_posts", subreddit_name, sort_type, limit, time_filter)
+    cached = _cache_get(_listing_cache, key)
+    if cached is not None:
+        return cached
+
     try:
-        reddit = get_reddit_client()
-        subreddit = reddit.subreddit(subreddit_name)
+        reddit = await get_reddit_client()
+        subreddit = await reddit.subreddit(subreddit_name)
         
         # Get posts based on sort type
-        if sort_type == "hot":
-            posts = subreddit.hot(limit=limit)
-        elif sort_type == "new":
-            posts = subreddit.new(limit=limit)
-        elif sort_type == "top":
-            posts = subreddit.top(time_filter=time_filter, limit=limit)
-        elif sort_type == "rising":
-            posts = subreddit.rising(limit=limit)
-        else:
-            return json.dumps({"error": "Invalid sort_type. Use 'hot', 'new', 'top', or 'rising'"})
+        fetch_posts = _SORT_DISPATCH.get(sort_type)
+        if fetch_posts is None:
+            return _dumps({"error": "Invalid sort_type. Use 'hot', 'new', 'top', or 'rising'"})
+        posts = fetch_posts(subreddit, limit, time_filter)
         
         # Extract post information
-        post_data = []
-        for post in posts:
-            post_info = {
-                "id": post.id,
-                "title": post.title,
-                "author": str(post.author) if post.author else "[deleted]",
-                "score": post.score,
-                "upvote_ratio": post.upvote_ratio,
-                "num_comments": post.num_comments,
-                "created_utc": post.created_utc,
-                "url": post.url,
-                "permalink": f"https://reddit.com{post.permalink}",
-                "selftext": post.selftext[:500] + "..." if len(post.selftext) > 500 else post.selftext,
-                "is_self": post.is_self,
-                "over_18": post.over_18,
-                "spoiler": post.spoiler,
-                "stickied": post.stickied,
-                "flair_text": post.link_flair_text
-            }
-            post_data.append(post_info)
+        post_data = [_post_to_dict(post, 500, include_subreddit=False) async for post in posts]
         
-        return json.dumps({
+        return _cache_set(_listing_cache, key, _dumps({
             "subreddit": subreddit_name,
             "sort_type": sort_type,
             "time_filter": time_filter if sort_type == "top" else None,
             "count": len(post_data),
             "posts": post_data
-        }, indent=2)
+        }))
         
     except Exception as e:
-        return json.dumps({"error": f"Failed to fetch posts: {str(e)}"})
+        return _dumps({"error": f"Failed to fetch posts: {str(e)}"})
 
 @mcp.tool()
-def get_post_details(post_id: str, include_comments: bool = False, comment_limit: int = 10) -> str:
+async def get_post_details(post_id: str, include_comments: bool = False, comment_limit: int = 10) -> str:
     """
     Get detailed information about a specific Reddit post.
     
@@ -109,57 +223,36 @@ def get_post_details(post_id: str, include_comments: bool = False, comment_limit
     Returns:
         JSON string containing detailed post information
     """
+    key = ("get_post_details", post_id, include_comments, comment_limit)
+    cached = _cache_get(_details_cache, key)
+    if cached is not None:
+        return cached
+
     try:
-        reddit = get_reddit_client()
-        submission = reddit.submission(id=post_id)
+        reddit = await get_reddit_client()
+        # fetch=True loads every submission field in one request up front
+        submission = await reddit.submission(id=post_id, fetch=True)
         
-        post_details = {
-            "id": submission.id,
-            "title": submission.title,
-            "author": str(submission.author) if submission.author else "[deleted]",
-            "subreddit": str(submission.subreddit),
-            "score": submission.score,
-            "upvote_ratio": submission.upvote_ratio,
-            "num_comments": submission.num_comments,
-            "created_utc": submission.created_utc,
-            "url": submission.url,
-            "permalink": f"https://reddit.com{submission.permalink}",
-            "selftext": submission.selftext,
-            "is_self": submission.is_self,
-            "over_18": submission.over_18,
-            "spoiler": submission.spoiler,
-            "stickied": submission.stickied,
-            "flair_text": submission.link_flair_text,
-            "gilded": submission.gilded,
-            "distinguished": submission.distinguished
-        }
+        post_details = _post_to_dict(submission)
+        post_details["gilded"] = submission.gilded
+        post_details["distinguished"] = submission.distinguished
         
         if include_comments:
-            submission.comments.replace_more(limit=0)
+            await submission.comments.replace_more(limit=0)
             comments = []
-            for comment in submission.comments[:comment_limit]:
-                if hasattr(comment, 'body'):
-                    comment_info = {
-                        "id": comment.id,
-                        "author": str(comment.author) if comment.author else "[deleted]",
-                        "body": comment.body[:300] + "..." if len(comment.body) > 300 else comment.body,
-                        "score": comment.score,
-                        "created_utc": comment.created_utc,
-                        "is_submitter": comment.is_submitter,
-                        "stickied": comment.stickied,
-                        "gilded": comment.gilded
-                    }
-                    comments.append(comment_info)
+            for comment in islice(submission.comments, comment_limit):
+                if isinstance(comment, asyncpraw.models.Comment):
+                    comments.append(_comment_to_dict(comment))
             
             post_details["comments"] = comments
         
-        return json.dumps(post_details, indent=2)
+        return _cache_set(_details_cache, key, _dumps(post_details))
         
     except Exception as e:
-        return json.dumps({"error": f"Failed to fetch post details: {str(e)}"})
+        return _dumps({"error": f"Failed to fetch post details: {str(e)}"})
 
 @mcp.tool()
-def search_reddit(query: str, sort: str = "relevance", time_filter: str = "all", limit: int = 10) -> str:
+async def search_reddit(query: str, sort: str = "relevance", time_filter: str = "all", limit: int = 10) -> str:
     """
     Search Reddit for posts matching a query.
     
@@ -172,45 +265,37 @@ def search_reddit(query: str, sort: str = "relevance", time_filter: str = "all",
     Returns:
         JSON string containing search results
     """
+    key = ("search_reddit", query, sort, time_filter, limit)
+    cached = _cache_get(_listing_cache, key)
+    if cached is not None:
+        return cached
+
     try:
-        reddit = get_reddit_client()
+        reddit = await get_reddit_client()
         
-        search_results = reddit.subreddit("all").search(
+        subreddit = await reddit.subreddit("all")
+        search_results = subreddit.search(
             query=query,
             sort=sort,
             time_filter=time_filter,
             limit=limit
         )
         
-        results = []
-        for post in search_results:
-            result_info = {
-                "id": post.id,
-                "title": post.title,
-                "author": str(post.author) if post.author else "[deleted]",
-                "subreddit": str(post.subreddit),
-                "score": post.score,
-                "num_comments": post.num_comments,
-                "created_utc": post.created_utc,
-                "url": post.url,
-                "permalink": f"https://reddit.com{post.permalink}",
-                "selftext": post.selftext[:200] + "..." if len(post.selftext) > 200 else post.selftext
-            }
-            results.append(result_info)
+        results = [_post_to_dict(post, 200, compact=True) async for post in search_results]
         
-        return json.dumps({
+        return _cache_set(_listing_cache, key, _dumps({
             "query": query,
             "sort": sort,
             "time_filter": time_filter,
             "count": len(results),
             "results": results
-        }, indent=2)
+        }))
         
     except Exception as e:
-        return json.dumps({"error": f"Search failed: {str(e)}"})
+        return _dumps({"error": f"Search failed: {str(e)}"})
 
 @mcp.tool()
-def get_subreddit_info(subreddit_name: str) -> str:
+async def get_subreddit_info(subreddit_name: str) -> str:
     """
     Get information about a subreddit.
     
@@ -220,14 +305,19 @@ def get_subreddit_info(subreddit_name: str) -> str:
     Returns:
         JSON string containing subreddit information
     """
+    key = ("get_subreddit_info", subreddit_name)
+    cached = _cache_get(_details_cache, key)
+    if cached is not None:
+        return cached
+
     try:
-        reddit = get_reddit_client()
-        subreddit = reddit.subreddit(subreddit_name)
+        reddit = await get_reddit_client()
+        subreddit = await reddit.subreddit(subreddit_name, fetch=True)
         
         subreddit_info = {
             "name": subreddit.display_name,
             "title": subreddit.title,
-            "description": subreddit.description[:500] + "..." if len(subreddit.description) > 500 else subreddit.description,
+            "description": _trunc(subreddit.description, 500),
             "subscribers": subreddit.subscribers,
             "active_users": subreddit.active_user_count,
             "created_utc": subreddit.created_utc,
@@ -238,10 +328,10 @@ def get_subreddit_info(subreddit_name: str) -> str:
             "lang": subreddit.lang
         }
         
-        return json.dumps(subreddit_info, indent=2)
+        return _cache_set(_details_cache, key, _dumps(subreddit_info))
         
     except Exception as e:
-        return json.dumps({"error": f"Failed to fetch subreddit info: {str(e)}"})
+        return _dumps({"error": f"Failed to fetch subreddit info: {str(e)}"})
 
 
 